@@ -1,2 +1 @@
-from .server import start_server
 from .client import LLTFClient as _Client
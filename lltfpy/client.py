@@ -1,14 +1,27 @@
 from logging import getLogger
 from .lltf import LLTFError
-import requests
+try:
+    from orjson import dumps as _dumps
+except ImportError:
+    from json import dumps as _dumps
 _DEFAULT_TIMEOUT = 1
-_DEFAULT_URL = 'localhost:50000/lltf'
+_DEFAULT_URL = 'http://127.0.0.1:50001/lltf'
+_JSON_HEADERS = {'Content-Type': 'application/json'}
+_STATUS_BODY = _dumps({'command': 'status'})
+#requests module, imported by the first LLTFClient so importing lltfpy does not pay for it
+_requests = None
 
 
 class LLTFClient:
+    __slots__ = ('address', 'timeout', '_session')
+
     def __init__(self, address=_DEFAULT_URL, timeout=_DEFAULT_TIMEOUT):
         self.address = address
         self.timeout = timeout
+        global _requests
+        if _requests is None:
+            import requests as _requests
+        self._session = _requests.Session()
 
     def get_wavelength(self):
         """
@@ -16,7 +29,7 @@ class LLTFClient:
 
         Returns wavelength or raises error
         """
-        w = self.status['wavelength']
+        w = self.status()['wavelength']
         try:
             w = float(w)
             return w
@@ -30,8 +43,9 @@ class LLTFClient:
         Returns true iff successful
         """
         try:
-            r = requests.post(self.address, json={'command': 'set_wave', 'data':x}, timeout=self.timeout)
-        except requests.exceptions.ConnectionError:
+            r = self._session.post(self.address, data=_dumps({'command': 'set_wave', 'wavelength': float(x)}),
+                                   headers=_JSON_HEADERS, timeout=self.timeout)
+        except _requests.exceptions.ConnectionError:
             raise LLTFError('HTTPConnectionError')
         if not r.ok:
             #extract error from r
@@ -47,7 +61,9 @@ class LLTFClient:
             dictionary of status information
         """
         try:
-            r = requests.post(self.address, json={'command': 'status'}, timeout=self.timeout)
-            return r.json()
-        except requests.exceptions.ConnectionError:
+            r = self._session.post(self.address, data=_STATUS_BODY, headers=_JSON_HEADERS, timeout=self.timeout)
+        except _requests.exceptions.ConnectionError:
             raise LLTFError('HTTPConnectionError')
+        if not r.ok:
+            raise LLTFError(r.text)
+        return r.json()
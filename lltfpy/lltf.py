@@ -1,19 +1,80 @@
-from .lltfdll import NKTContrast, PE_STATUS
+from threading import RLock
+from typing import NamedTuple
+from .lltfdll import NKTContrast, _status_message
 
 
-class LLTFError(Exception):
+class LLTFError(RuntimeError):
     pass
 
 
+class GratingInfo(NamedTuple):
+    index: int
+    name: str
+    count: int
+    range: tuple
+    extended_range: tuple
+
+
+class LLTFStatus(NamedTuple):
+    library_version: int
+    system_name: str
+    system_count: int
+    wavelength: float
+    range: tuple
+    grating: GratingInfo
+    harmonic_filter: tuple
+
+
+def _check(status, prefix):
+    """
+    Raises LLTFError describing status, prefixed by prefix, unless status is PE_SUCCESS.
+
+    """
+    if status:
+        raise LLTFError(prefix + ': ' + _status_message(status))
+
+
+def _check_wave(wavelength, new_wave, tolerance):
+    """
+    Raises LLTFError unless the wavelength read back from the filter, new_wave, is within
+    tolerance nm of the requested wavelength.
+
+    """
+    if abs(new_wave - wavelength) > tolerance:
+        raise LLTFError('Filter is at ' + str(new_wave) + ' nm after setting ' + str(wavelength) + ' nm')
+
+
 class LLTF:
     """
 
     Hardware class for connection to the LLTF High Contrast filter.
 
+    The connection is opened on first use and kept open until close() is called.
+    It can also be used as a context manager to close it when done:
+        with LLTF(conffile) as lltf:
+            for wavelength in wavelengths:
+                lltf.set_wave(wavelength)
+
     """
+    __slots__ = ('conffile', 'name', 'library_version', 'system_count', '_conffile_b', '_names',
+                 '_conn', '_nkt', '_lock', '_last_wave', '_meta')
 
     def __init__(self, conffile):
+        self.conffile = conffile
+        self._conffile_b = conffile.encode('ASCII')
+        #Name of the open system, and the ASCII names already looked up keyed by system index
+        self.name = None
+        self._names = {}
+        self.library_version = None
+        self.system_count = None
         self._conn = None
+        #Last central wavelength read from or set on the filter, None when unknown
+        self._last_wave = None
+        #(wavelength range, GratingInfo, harmonic filter available) of the open system, None until read
+        self._meta = None
+        self._nkt = NKTContrast()
+        #Serializes use of the handle and the shared ctypes out-parameters across threads
+        self._lock = RLock()
 
     def _open(self, index=0):
         """
@@ -26,14 +87,23 @@ class LLTF:
             index (Optional) - Position of the system. Default is zero.
 
         """
-        NKT = NKTContrast()
-        if self._conn is None:
-            conffile = self.conffile
-            library_vers, num_sys, peHandle, name, create_status, open_status = NKT.NKT_Open(conffile)
-            if create_status or open_status != PE_STATUS.PE_SUCCESS:
-                raise RuntimeError
-            self._conn = peHandle
+        if self._conn is not None:
             return self._conn
+        NKT = self._nkt
+        library_vers, num_sys, peHandle, name, create_status, name_status, open_status = NKT.NKT_Open(
+            self._conffile_b, index, self._names.get(index))
+        _check(create_status, 'Could not create handle')
+        if name_status or open_status:
+            #The handle was created but is not stored, release it before raising
+            NKT.NKT_Destroy(peHandle)
+            _check(name_status, 'Could not retrieve system name')
+            _check(open_status, 'Could not open system')
+        self._names[index] = name
+        self.name = name.decode('ascii')
+        self.library_version = library_vers
+        self.system_count = num_sys
+        self._conn = peHandle
+        return peHandle
 
     def _close(self, peHandle):
         """
@@ -44,41 +114,108 @@ class LLTF:
             peHandle (Required) - Handle to system
 
         """
-        NKT = NKTContrast()
+        NKT = self._nkt
+        self._last_wave = None
+        self._meta = None
         if self._conn is not None:
             closestatus, destroystatus = NKT.NKT_Close(peHandle)
-            if closestatus or destroystatus != PE_STATUS.PE_SUCCESS:
-                raise RuntimeError
+            #PE_Destroy has released the handle whatever the statuses, so it must not be reused
             self._conn = None
+            if closestatus and destroystatus:
+                raise LLTFError('Could not close system: ' + _status_message(closestatus) +
+                                '; Could not destroy handle: ' + _status_message(destroystatus))
+            _check(closestatus, 'Could not close system')
+            _check(destroystatus, 'Could not destroy handle')
 
-    def set_wave(self, wavelength):
+    def close(self):
         """
 
-        Calibrates central wavelength of the filter.
+        Closes the connection with the system if it is open. The next call reopens it.
+
+        """
+        with self._lock:
+            self._close(self._conn)
+
+    def __enter__(self):
+        with self._lock:
+            self._open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def set_wave(self, wavelength, verify=False, tolerance=0.0):
+        """
+
+        Calibrates central wavelength of the filter. Returns True, or raises LLTFError.
 
         Parameters
-            conffile (Required) - Path to configuration file.
-                Usually in 'C:\Program Files (x86)\Photon etc\PHySpecV2\system.xml'
             wavelength (Required) - Desired central wavelength in nm
+            verify (Optional) - Read the wavelength back after setting it and raise LLTFError if it
+                differs from the requested wavelength by more than tolerance. Default is False.
+            tolerance (Optional) - Allowed difference in nm when verifying. Default is 0.
 
         """
-        close = False
-        NKT = NKTContrast()
-        try:
-            peHandle = self._open()
-            prev_wave, prev_min, prev_max, wavestatus, rangestatus = NKT.NKT_Wavelength(peHandle)
-            new_wave, calibstatus, new_wavestatus = NKT.NKT_Calibrate(peHandle, wavelength)
-            return True
-        except wavelength == prev_wave:
-            close = True
-        except wavestatus or rangestatus or new_wavestatus or calibstatus != PE_STATUS.PE_SUCCESS:
-            close = True
-        except new_wave == prev_wave:
-            close = True
-        finally:
-            if close:
+        with self._lock:
+            NKT = self._nkt
+            peHandle = self._conn or self._open()
+            try:
+                prev_wave = self._last_wave
+                if prev_wave is None:
+                    prev_wave, wavestatus = NKT.NKT_GetWavelength(peHandle)
+                    _check(wavestatus, 'Could not retrieve wavelength')
+                if wavelength == prev_wave:
+                    return True
+                if verify:
+                    new_wave, calibstatus, new_wavestatus = NKT.NKT_Calibrate(peHandle, wavelength)
+                    _check(calibstatus, 'Could not set wavelength')
+                    _check(new_wavestatus, 'Could not retrieve wavelength')
+                    _check_wave(wavelength, new_wave, tolerance)
+                else:
+                    calibstatus = NKT.NKT_SetWavelength(peHandle, wavelength)
+                    _check(calibstatus, 'Could not set wavelength')
+                    new_wave = wavelength
+            except Exception:
                 self._close(peHandle)
-        return False
+                raise
+            self._last_wave = new_wave
+            return True
+
+    def sweep(self, wavelengths, callback=None, verify=False, tolerance=0.0):
+        """
+
+        Steps the central wavelength of the filter through a sequence of wavelengths,
+        keeping the connection open and making a single SDK call per step, or two with verify.
+
+        Parameters
+            wavelengths (Required) - Sequence or NumPy array of central wavelengths in nm
+            callback (Optional) - Called with each wavelength once the filter is set to it,
+                the wavelength read back from the filter when verify is True
+            verify (Optional) - Read the wavelength back after each step and raise LLTFError if it
+                differs from the requested wavelength by more than tolerance. Default is False.
+            tolerance (Optional) - Allowed difference in nm when verifying. Default is 0.
+
+        """
+        with self._lock:
+            NKT = self._nkt
+            peHandle = self._conn or self._open()
+            self._last_wave = None
+            for wavelength, calibstatus in NKT.NKT_Sweep(peHandle, wavelengths):
+                if calibstatus:
+                    self._close(peHandle)
+                    _check(calibstatus, 'Could not set wavelength')
+                if verify:
+                    new_wave, wavestatus = NKT.NKT_GetWavelength(peHandle)
+                    try:
+                        _check(wavestatus, 'Could not retrieve wavelength')
+                        _check_wave(wavelength, new_wave, tolerance)
+                    except LLTFError:
+                        self._close(peHandle)
+                        raise
+                    wavelength = new_wave
+                self._last_wave = wavelength
+                if callback is not None:
+                    callback(wavelength)
 
     def get_wave(self):
         """
@@ -89,18 +226,70 @@ class LLTF:
                 Usually in 'C:\Program Files (x86)\Photon etc\PHySpecV2\system.xml'
 
         """
-        close = False
-        NKT = NKTContrast()
-        try:
-            peHandle = self._open()
-            wave, minimum, maximum, wavestatus, rangestatus = NKT.NKT_Wavelength(peHandle)
-            return True
-        except wavestatus or rangestatus != PE_STATUS.PE_SUCCESS:
-            close = True
-        finally:
-            if close:
+        with self._lock:
+            NKT = self._nkt
+            peHandle = self._conn or self._open()
+            try:
+                wave, minimum, maximum, wavestatus, rangestatus = NKT.NKT_Wavelength(peHandle)
+                _check(wavestatus, 'Could not retrieve wavelength')
+                _check(rangestatus, 'Could not retrieve wavelength range')
+            except Exception:
                 self._close(peHandle)
-        return False
+                raise
+            self._last_wave = wave
+            return wave, minimum, maximum
+
+    def _read_grating(self, peHandle):
+        """
+        Reads the index, name, count and wavelength ranges of the current grating.
+
+        Parameters
+            peHandle (Required) - Handle to system
+
+        """
+        gindex, gname, gcount, minimum, maximum, ext_min, ext_max, gratingstat, namestat, countstat, rangestat, extstat = self._nkt.NKT_GratingStatus(peHandle)
+        _check(gratingstat, 'Could not retrieve grating index')
+        _check(namestat, 'Could not retrieve grating name')
+        _check(countstat, 'Could not retrieve grating count')
+        _check(rangestat, 'Could not retrieve grating range')
+        _check(extstat, 'Could not retrieve grating extended range')
+        return GratingInfo(gindex, gname.decode('ascii'), gcount, (minimum, maximum), (ext_min, ext_max))
+
+    def status(self):
+        """
+
+        Returns an LLTFStatus with the library version, system name and count, central
+        wavelength and range, grating information and harmonic filter (available, enabled).
+
+        """
+        with self._lock:
+            NKT = self._nkt
+            peHandle = self._conn or self._open()
+            try:
+                #The ranges, grating and harmonic filter availability only change on reopen or
+                #grating calibration
+                meta = self._meta
+                if meta is None:
+                    wave, minimum, maximum, wavestatus, rangestatus = NKT.NKT_Wavelength(peHandle)
+                    _check(wavestatus, 'Could not retrieve wavelength')
+                    _check(rangestatus, 'Could not retrieve wavelength range')
+                    meta = ((minimum, maximum), self._read_grating(peHandle),
+                            bool(NKT.NKT_HasHarmonicFilter(peHandle)))
+                else:
+                    wave, wavestatus = NKT.NKT_GetWavelength(peHandle)
+                    _check(wavestatus, 'Could not retrieve wavelength')
+                wave_range, grating, available = meta
+                enabled = False
+                if available:
+                    enabled, enablestatus = NKT.NKT_HarmonicFilterEnabled(peHandle)
+                    _check(enablestatus, 'Could not retrieve harmonic filter state')
+            except Exception:
+                self._close(peHandle)
+                raise
+            self._last_wave = wave
+            self._meta = meta
+            return LLTFStatus(self.library_version, self.name, self.system_count, wave, wave_range,
+                              grating, (available, bool(enabled)))
 
     def grating_wave(self, wavelength):
         """
@@ -113,22 +302,25 @@ class LLTF:
                 Usually in 'C:\Program Files (x86)\Photon etc\PHySpecV2\system.xml'
 
         """
-        close = False
-        NKT = NKTContrast()
-        try:
-            peHandle = self._open()
-            gindex, minimum, maximum, ext_min, ext_max, namestat, countstat, rangestat, extstat = NKT.NKT_GratingStatus(peHandle)
-            central_wave = (maximum - minimum)/2 + minimum
-            min_n, max_n, calibstat, rangestat_n = NKT.NKT_CalibrateGrating(peHandle, gindex, wavelength)
+        with self._lock:
+            NKT = self._nkt
+            peHandle = self._conn or self._open()
+            try:
+                grating = self._meta[1] if self._meta is not None else self._read_grating(peHandle)
+                minimum, maximum = grating.range
+                central_wave = (maximum - minimum)/2 + minimum
+                if wavelength == central_wave:
+                    return True
+                self._last_wave = None
+                self._meta = None
+                min_n, max_n, calibstat, rangestat_n = NKT.NKT_CalibrateGrating(peHandle, grating.index, wavelength)
+                _check(calibstat, 'Could not calibrate grating')
+                _check(rangestat_n, 'Could not retrieve grating range')
+            except Exception:
+                self._close(peHandle)
+                raise
             new_wave = (max_n - min_n)/2 + min_n
-            return True
-        except namestat or countstat or rangestat or extstat or calibstat or rangestat_n != PE_STATUS.PE_SUCCESS:
-            close = True
-        except wavelength == central_wave:
-            close = True
-        except new_wave == central_wave:
-            close = True
-        finally:
-            if close:
+            if new_wave == central_wave:
                 self._close(peHandle)
-        return False
+                return False
+            return True
@@ -1,7 +1,12 @@
-from ctypes import *
+from ctypes import (CDLL, POINTER, byref, c_char, c_char_p, c_double, c_int, c_void_p,
+                    create_string_buffer, sizeof)
+from os import path
+from struct import calcsize
 from sys import platform
 from enum import IntEnum
 
+__all__ = ['NKTContrast', 'PE_STATUS']
+
 class PE_STATUS(IntEnum):
     """
     Passes enums in c into Python
@@ -24,25 +29,135 @@ class PE_STATUS(IntEnum):
 
     @classmethod
     def from_param(cls, obj):
-        if not is_instance(obj, PE_STATUS):
+        if not isinstance(obj, PE_STATUS):
             raise TypeError('Not a PE_STATUS instance.')
         return int(obj)
 
-class PE_HANDLE:
+#PE_STATUS members indexed by value, the status codes are dense from zero
+_PE_BY_VALUE = tuple(PE_STATUS)
+
+#Descriptions of the status codes from PE_Filter.h, indexed by value
+_STATUS_MESSAGES = (
+    'Successful operation',
+    'Handle is already deleted or null',
+    'Instrument communication failure',
+    'Configuration file is missing',
+    'Configuration file is corrupted',
+    'Wavelength is out of bound',
+    'No harmonic present in the system',
+    "The requested filter doesn't exist",
+    'Unknown status',
+    "The requested grating doesn't exist",
+    'The buffer is null',
+    'The buffer is too small',
+    'The filter configuration is unsupported',
+    'No filter is connected',
+)
+
+def _status_message(status):
+    """
+    Returns a readable description of a status code, including its PE_STATUS name.
+
+    """
+    if 0 <= status < len(_STATUS_MESSAGES):
+        return _STATUS_MESSAGES[status] + ' (' + _PE_BY_VALUE[status].name + ')'
+    return 'Unknown status code ' + str(int(status))
+
+class PE_HANDLE(c_void_p):
     """
     A c void pointer. PE_HANDLE structure where handle is stored
 
     """
-    def __init__(self, c_void_p):
-        self._as_parameter_ = c_void_p
 
-class CPE_HANDLE:
+class CPE_HANDLE(c_void_p):
     """
     A c void constant pointer. Constant handle to system.
 
     """
-    def __init__(self, c_void_p):
-        self._as_parameter_ = c_void_p
+
+#Prototypes of the PE_* functions in PE_Filter.h, applied once when the library is loaded.
+#Status codes are returned as plain ints rather than PE_STATUS, so that a code outside PE_STATUS
+#reaches the caller's status check instead of raising ValueError part way through, for example
+#before a created handle is destroyed. PE_STATUS names the codes in messages and is the
+#PE_GetStatusStr argtype.
+_PROTOTYPES = {
+    #Acquire handle on LLTF Contrast
+    'PE_Create': (c_int, [c_char_p, POINTER(PE_HANDLE)]),
+    #Destroys filter resource created with PE_Create
+    'PE_Destroy': (c_int, [PE_HANDLE]),
+    #Retrieves number of systems available in config file
+    'PE_GetSystemCount': (c_int, [CPE_HANDLE]),
+    #Retrieves system name
+    'PE_GetSystemName': (c_int, [CPE_HANDLE, c_int, POINTER(c_char), c_int]),
+    #Retrieves version number of library
+    'PE_GetLibraryVersion': (c_int, []),
+    #Retrieves explanation for a status code
+    'PE_GetStatusStr': (c_char_p, [PE_STATUS]),
+    #Open communication channel
+    'PE_Open': (c_int, [PE_HANDLE, c_char_p]),
+    #Close communication channel
+    'PE_Close': (c_int, [PE_HANDLE]),
+    #Returns the central wavelength filtered by the system in nanometers
+    'PE_GetWavelength': (c_int, [CPE_HANDLE, POINTER(c_double)]),
+    #Sets central wavelength filtered by system in nanometers
+    'PE_SetWavelength': (c_int, [PE_HANDLE, c_double]),
+    #Retrieves wavelength range of system in nanometers
+    'PE_GetWavelengthRange': (c_int, [CPE_HANDLE, POINTER(c_double), POINTER(c_double)]),
+    #Retrieves availability of the harmonic filter accessory, non-zero if available
+    'PE_HasHarmonicFilter': (c_int, [CPE_HANDLE]),
+    #Retrieves state of the harmonic filter accessory
+    'PE_GetHarmonicFilterEnabled': (c_int, [CPE_HANDLE, POINTER(c_int)]),
+    #Enables or disables the harmonic filter accessory
+    'PE_SetHarmonicFilterEnabled': (c_int, [PE_HANDLE, c_int]),
+    #Retrieves grating
+    'PE_GetGrating': (c_int, [PE_HANDLE, POINTER(c_int)]),
+    #Retrieves grating name
+    'PE_GetGratingName': (c_int, [CPE_HANDLE, c_int, POINTER(c_char), c_int]),
+    #Retrieves system's grating count number
+    'PE_GetGratingCount': (c_int, [CPE_HANDLE, POINTER(c_int)]),
+    #Retrieve wavelength range of grating in nanometers
+    'PE_GetGratingWavelengthRange': (c_int, [CPE_HANDLE, c_int, POINTER(c_double), POINTER(c_double)]),
+    #Retrieve extended wavelength range of grating in nanometers
+    'PE_GetGratingWavelengthExtendedRange': (c_int, [CPE_HANDLE, c_int, POINTER(c_double), POINTER(c_double)]),
+    #Sets central wavelength filtered by system in nanometers using a grating
+    'PE_SetWavelengthOnGrating': (c_int, [PE_HANDLE, c_int, c_double]),
+}
+
+#Path of the SDK library for this platform, None when the platform is unsupported.
+#sys.platform is 'win32' under 64-bit Python too, so the pointer size picks the build.
+#The SDK is looked up next to this module first, then under the working directory.
+if platform.startswith('win'):
+    _LIB_DIR = 'win' + str(8*calcsize('P'))
+    _LIB_PATH = path.join(path.dirname(path.abspath(__file__)), _LIB_DIR, 'PE_Filter_SDK.dll')
+    if not path.exists(_LIB_PATH):
+        _LIB_PATH = './' + _LIB_DIR + '/PE_Filter_SDK.dll'
+else:
+    _LIB_PATH = None
+
+#SDK library shared by every NKTContrast in the process, loaded on first use
+_library = None
+
+def _load_library():
+    """
+    Loads the SDK library and applies the PE_* prototypes, once per process.
+
+    """
+    global _library
+    if _library is None:
+        if _LIB_PATH is None:
+            raise Exception('Not running on a Windows platform.')
+        #CDLL (not PyDLL) releases the GIL for the duration of each call, so other
+        #threads keep running while the filter moves
+        library = CDLL(_LIB_PATH)
+        for name, (restype, argtypes) in _PROTOTYPES.items():
+            func = getattr(library, name)
+            func.restype = restype
+            func.argtypes = argtypes
+        _library = library
+    return _library
+
+#Size of the buffer handed to PE_GetSystemName and PE_GetGratingName
+NAME_BUFFER_SIZE = 256
 
 class NKTContrast():
     """
@@ -50,58 +165,55 @@ class NKTContrast():
 
     """
     def __init__(self):
-        if platform.startswith('win64'):
-            lib_path = './win64/PE_Filter_SDK.dll'
-        elif platform.startswith('win32'):
-            lib_path = './win32/PE_Filter_SDK.dll'
-        else:
-            raise Exception
-        self.library = CDLL(lib_path)
-
-    def NKT_Open(self, conffile, index=0):
+        self.library = _load_library()
+
+        #Out-parameters reused by every call instead of allocated per call
+        self._out_wave = c_double()
+        self._out_min = c_double()
+        self._out_max = c_double()
+        self._out_ext_min = c_double()
+        self._out_ext_max = c_double()
+        self._out_index = c_int()
+        self._out_count = c_int()
+        self._out_enable = c_int()
+        self._out_name = create_string_buffer(NAME_BUFFER_SIZE)
+        #byref() builds a new argument object on every call, so keep one per out-parameter
+        self._ref_wave = byref(self._out_wave)
+        self._ref_min = byref(self._out_min)
+        self._ref_max = byref(self._out_max)
+        self._ref_ext_min = byref(self._out_ext_min)
+        self._ref_ext_max = byref(self._out_ext_max)
+        self._ref_index = byref(self._out_index)
+        self._ref_count = byref(self._out_count)
+        self._ref_enable = byref(self._out_enable)
+
+    def NKT_Open(self, conffile, index=0, name=None):
         """
         Creates and opens communication channel with system
 
+        Inputs:
+            conffile (Required) - Path to configuration file, as str or ASCII bytes
+            index (Optional) - Position of the system. Default is zero.
+            name (Optional) - System name as ASCII bytes, from an earlier NKT_Open with the
+                same index. Skips the system name lookup.
+
         """
         library = self.library
 
-        #Acquire handle on LLTF Contrast
-        pe_Create = library.PE_Create
-        pe_Create.argtypes = [c_char_p, POINTER(PE_HANDLE)]
-        pe_Create.restype = PE_STATUS
-
-        #Retrieves number of systems available in config file
-        pe_GetSystemCount = library.PE_GetSystemCount
-        pe_GetSystemCount.argtypes = [CPE_HANDLE]
-        pe_GetSystemCount.restype = c_int
-
-        #Retrieves system name
-        pe_GetSystemName = library.PE_GetSystemName
-        pe_GetSystemName.argtypes = [CPE_HANDLE, c_int, POINTER(c_char), c_int]
-        pe_GetSystemName.restype = PE_STATUS
-
-        #Retrieves version number of library
-        pe_LibraryVersion = library.PE_GetLibraryVersion
-        pe_LibraryVersion.restype = c_int
-
-        #Open communication channel
-        pe_Open = library.PE_Open
-        pe_Open.argtypes = [PE_HANDLE, c_char_p]
-        pe_Open.restype = PE_STATUS
-
-
-        conffile = conffile.encode('ASCII')
+        if isinstance(conffile, str):
+            conffile = conffile.encode('ASCII')
         peHandle = PE_HANDLE()
-        create_status = pe_Create(conffile, byref(peHandle))
+        create_status = library.PE_Create(conffile, byref(peHandle))
         peHandle = peHandle.value
-        num_sys = pe_GetSystemCount(peHandle)
-        name = c_char()
-        #How to get system size??? Need to look into
-        name_status = pe_GetSystemName(peHandle, index, byref(name), sizeof(name))
-        name = name.value
-        library_vers = pe_LibraryVersion()
-        open_status = pe_Open(peHandle, name.value)
-        return library_vers, num_sys, peHandle, name, create_status, open_status
+        num_sys = library.PE_GetSystemCount(peHandle)
+        if name is None:
+            name_status = library.PE_GetSystemName(peHandle, index, self._out_name, sizeof(self._out_name))
+            name = self._out_name.value
+        else:
+            name_status = PE_STATUS.PE_SUCCESS
+        library_vers = library.PE_GetLibraryVersion()
+        open_status = library.PE_Open(peHandle, name)
+        return library_vers, num_sys, peHandle, name, create_status, name_status, open_status
 
     def NKT_StatusStr(self, pestatuscode):
         """
@@ -112,13 +224,7 @@ class NKTContrast():
             Should be in form PE_STATUS.PE_ERRORCODE
 
         """
-        library = self.library
-
-        pe_GetStatusStr = library.PE_GetStatusStr
-        pe_GetStatusStr.argtypes = [PE_STATUS]
-        pe_GetStatusStr.restype = c_char_p
-
-        statusstring = pe_GetStatusStr(pestatuscode)
+        statusstring = self.library.PE_GetStatusStr(pestatuscode)
         return statusstring
 
     def NKT_Wavelength(self, peHandle):
@@ -131,26 +237,35 @@ class NKTContrast():
         """
         library = self.library
 
-        #Returns the central wavelength filtered by the system in nanometers
-        pe_GetWavelength = library.PE_GetWavelength
-        pe_GetWavelength.argtypes = [CPE_HANDLE, POINTER(c_double)]
-        pe_GetWavelength.restype = PE_STATUS
-
-        #Retrieves wavelength range of system in nanometers
-        pe_GetWavelengthRange = library.PE_GetWavelengthRange
-        pe_GetWavelengthRange.argtypes = [CPE_HANDLE, POINTER(c_double), POINTER(c_double)]
-        pe_GetWavelengthRange.restype = PE_STATUS
-
-        wavelength = c_double()
-        getwavestatus = pe_GetWavelength(peHandle, byref(wavelength))
-        minimum = c_double()
-        maximum = c_double()
-        getrangestatus = pe_GetWavelengthRange(peHandle, byref(minimum), byref(maximum))
-        wavelength_n = wavelength.value
-        minimum_n = minimum.value
-        maximum_n = maximum.value
+        getwavestatus = library.PE_GetWavelength(peHandle, self._ref_wave)
+        getrangestatus = library.PE_GetWavelengthRange(peHandle, self._ref_min, self._ref_max)
+        wavelength_n = self._out_wave.value
+        minimum_n = self._out_min.value
+        maximum_n = self._out_max.value
         return wavelength_n, minimum_n, maximum_n, getwavestatus, getrangestatus
 
+    def NKT_GetWavelength(self, peHandle):
+        """
+        Returns the central wavelength only, without the wavelength range.
+
+        Inputs:
+            peHandle (required) - Handle retrieved from NKT_Open
+
+        """
+        getwavestatus = self.library.PE_GetWavelength(peHandle, self._ref_wave)
+        return self._out_wave.value, getwavestatus
+
+    def NKT_SetWavelength(self, peHandle, wavelength):
+        """
+        Sets the central wavelength without reading it back.
+
+        Inputs:
+            peHandle (required) - Handle retrieved from NKT_Open
+            wavelength (required) - Desired central wavelength to be filtered by system (nm)
+
+        """
+        return self.library.PE_SetWavelength(peHandle, wavelength)
+
     def NKT_Calibrate(self, peHandle, wavelength):
         """
         Calibrates the instrument.
@@ -162,20 +277,62 @@ class NKTContrast():
         """
         library = self.library
 
-        #Sets central wavelength filtered by system in nanometers
-        pe_SetWavelength = library.PE_SetWavelength
-        pe_SetWavelength.argtypes = [PE_HANDLE, c_double]
-        pe_SetWavelength.restype = PE_STATUS
+        setwavestatus = library.PE_SetWavelength(peHandle, wavelength)
+        getwavestatus = library.PE_GetWavelength(peHandle, self._ref_wave)
+        wavelen_calib = self._out_wave.value
+        return wavelen_calib, setwavestatus, getwavestatus
 
-        pe_GetWavelength = library.PE_GetWavelength
-        pe_GetWavelength.argtypes = [CPE_HANDLE, POINTER(c_double)]
-        pe_GetWavelength.restype = PE_STATUS
+    def NKT_Sweep(self, peHandle, wavelengths):
+        """
+        Steps the central wavelength through a sequence of wavelengths, yielding
+        (wavelength, setwavestatus) after each step so the caller can measure.
 
-        setwavestatus = pe_SetWavelength(peHandle, wavelength)
-        newwavelength = c_double()
-        getwavestatus = pe_GetWavelength(peHandle, byref(newwavelength))
-        wavelen_calib = newwavelength.value
-        return wavelen_calib, setwavestatus, getwavestatus
+        Inputs:
+            peHandle (required) - Handle retrieved from NKT_Open
+            wavelengths (required) - Sequence or NumPy array of central wavelengths (nm)
+
+        """
+        if hasattr(wavelengths, 'tolist'):
+            wavelengths = wavelengths.tolist()
+        pe_SetWavelength = self.library.PE_SetWavelength
+        for wavelength in wavelengths:
+            yield wavelength, pe_SetWavelength(peHandle, wavelength)
+
+    def NKT_HarmonicFilter(self, peHandle):
+        """
+        Returns the availability and the state of the harmonic filter accessory.
+
+        Inputs:
+            peHandle (required) - Handle retrieved from NKT_Open
+
+        """
+        available = self.NKT_HasHarmonicFilter(peHandle)
+        if not available:
+            #The state query would only report PE_MISSING_HARMONIC_FILTER
+            return available, 0, PE_STATUS.PE_SUCCESS
+        enabled, enablestatus = self.NKT_HarmonicFilterEnabled(peHandle)
+        return available, enabled, enablestatus
+
+    def NKT_HasHarmonicFilter(self, peHandle):
+        """
+        Returns non-zero if the harmonic filter accessory is available.
+
+        Inputs:
+            peHandle (required) - Handle retrieved from NKT_Open
+
+        """
+        return self.library.PE_HasHarmonicFilter(peHandle)
+
+    def NKT_HarmonicFilterEnabled(self, peHandle):
+        """
+        Returns the state of the harmonic filter accessory, only meaningful when it is available.
+
+        Inputs:
+            peHandle (required) - Handle retrieved from NKT_Open
+
+        """
+        enablestatus = self.library.PE_GetHarmonicFilterEnabled(peHandle, self._ref_enable)
+        return self._out_enable.value, enablestatus
 
     def NKT_GratingStatus(self, peHandle):
         """
@@ -188,50 +345,19 @@ class NKTContrast():
         """
         library = self.library
 
-        #Retrieves grating
-        pe_GetGrating = library.PE_GetGrating
-        pe_GetGrating.argtypes = [PE_HANDLE, POINTER(c_int)]
-        pe_GetGrating.restype = PE_STATUS
-
-        #Retrieves grating name
-        pe_GetGratingName = library.PE_GetGratingName
-        pe_GetGratingName.argtypes = [CPE_HANDLE, c_int, POINTER(c_char), c_int]
-        pe_GetGratingName.restype = PE_STATUS
-
-        #Retrieves system's grating count number
-        pe_GetGratingCount = library.PE_getGratingCount
-        pe_GetGratingCount.argtypes = [CPE_HANDLE, POINTER(c_int)]
-        pe_GetGratingCount.restype = PE_STATUS
-
-        #Retrieve wavelength range of grating in nanometers
-        pe_GetGratingWavelengthRange = library.PE_GetGratingWavelengthRange
-        pe_GetGratingWavelengthRange.argtypes = [CPE_HANDLE, c_int, POINTER(c_double), POINTER(c_double)]
-        pe_GetGratingWavelengthRange.restype = PE_STATUS
-
-        #Retrieve extended wavelength range of grating in nanometers
-        pe_GetGratingWavelengthExtendedRange = library.PE_GetGratingWavelengthExtendedRange
-        pe_GetGratingWavelengthExtendedRange.argtypes = [CPE_HANDLE, c_int, POINTER(c_double), POINTER(c_double)]
-        pe_GetGratingWavelengthExtendedRange.restype = PE_STATUS
-
-        gratingIndex = c_int()
-        getgratingstatus = pe_GetGrating(peHandle, byref(gratingIndex))
-        gindex = gratingIndex.value
-        name = c_char()
-        #size = ??
-        gratingnamestatus = pe_GetGratingName(peHandle, gindex, byref(name), size)
-        count = c_int()
-        gratingcountstatus = pe_GetGratingCount(peHandle, byref(count))
-        minimum = c_double()
-        maximum = c_double()
-        gratingrangestatus = pe_GetGratingWavelengthRange(peHandle, gindex, byref(minimum), byref(maximum))
-        extended_min = c_double()
-        extended_max = c_double()
-        extendedstatus = pe_GetGratingWavelengthExtendedRange(peHandle, gindex, byref(extended_min), byref(extended_max))
-        minimum = minimum.value
-        maximum = maximum.value
-        extended_min = extended_min.value
-        extended_max = extended_max.value
-        return gindex, minimum, maximum, extended_min, extended_max, gratingnamestatus, gratingcountstatus, gratingrangestatus, extendedstatus
+        getgratingstatus = library.PE_GetGrating(peHandle, self._ref_index)
+        gindex = self._out_index.value
+        gratingnamestatus = library.PE_GetGratingName(peHandle, gindex, self._out_name, sizeof(self._out_name))
+        gname = self._out_name.value
+        gratingcountstatus = library.PE_GetGratingCount(peHandle, self._ref_count)
+        gcount = self._out_count.value
+        gratingrangestatus = library.PE_GetGratingWavelengthRange(peHandle, gindex, self._ref_min, self._ref_max)
+        extendedstatus = library.PE_GetGratingWavelengthExtendedRange(peHandle, gindex, self._ref_ext_min, self._ref_ext_max)
+        minimum = self._out_min.value
+        maximum = self._out_max.value
+        extended_min = self._out_ext_min.value
+        extended_max = self._out_ext_max.value
+        return gindex, gname, gcount, minimum, maximum, extended_min, extended_max, getgratingstatus, gratingnamestatus, gratingcountstatus, gratingrangestatus, extendedstatus
 
     def NKT_CalibrateGrating(self, peHandle, gratingIndex, wavelength):
         """
@@ -245,23 +371,22 @@ class NKTContrast():
         """
         library = self.library
 
-        #Sets central wavelength filtered by system in nanometers
-        pe_SetWavelengthOnGrating = library.PE_SetWavelengthOnGrating
-        pe_SetWavelengthOnGrating.argtypes = [PE_HANDLE, c_int, c_double]
-        pe_SetWavelengthOnGrating.restype = PE_STATUS
-
-        pe_GetGratingWavelengthRange = library.PE_GetGratingWavelengthRange
-        pe_GetGratingWavelengthRange.argtypes = [CPE_HANDLE, c_int, POINTER(c_double), POINTER(c_double)]
-        pe_GetGratingWavelengthRange.restype = PE_STATUS
-
-        gratingcalibstatus = pe_SetWavelengthOnGrating(peHandle, gratingIndex, wavelength)
-        minimum = c_double()
-        maximum = c_double()
-        gratingrangestatus_n = pe_GetGratingWavelengthRange(peHandle, gratingIndex, byref(minimum), byref(maximum))
-        minimum_n = minimum.value
-        maximum_n = maximum.value
+        gratingcalibstatus = library.PE_SetWavelengthOnGrating(peHandle, gratingIndex, wavelength)
+        gratingrangestatus_n = library.PE_GetGratingWavelengthRange(peHandle, gratingIndex, self._ref_min, self._ref_max)
+        minimum_n = self._out_min.value
+        maximum_n = self._out_max.value
         return minimum_n, maximum_n, gratingcalibstatus, gratingrangestatus_n
 
+    def NKT_Destroy(self, peHandle):
+        """
+        Destroys a handle created by NKT_Open without closing it, for when opening failed
+
+        Inputs:
+            peHandle (required) - Handle retrieved from NKT_Open
+
+        """
+        return self.library.PE_Destroy(peHandle)
+
     def NKT_Close(self, peHandle):
         """
         Closes communication channel with system
@@ -272,17 +397,7 @@ class NKTContrast():
         """
         library = self.library
 
-        #Close communication channel
-        pe_Close = library.PE_Close
-        pe_Close.argtypes = [PE_HANDLE]
-        pe_Close.restype = PE_STATUS
-
-        #Destroys filter resource created with PE_Create
-        pe_Destroy = library.PE_Destroy
-        pe_Destroy.argtypes = [PE_HANDLE]
-        pe_Destroy.restype = PE_STATUS
-
-        closestatus = pe_Close(peHandle)
-        destroystatus = pe_Destroy(peHandle)
+        closestatus = library.PE_Close(peHandle)
+        destroystatus = library.PE_Destroy(peHandle)
 
         return closestatus, destroystatus
@@ -74,7 +74,8 @@ class LLTFAPI(Resource):
                             help='Command must be one of: '+', '.join(choices), location='json')
         args = parser.parse_args()
         if args.command == 'status':
-            ret = lltf.status()
+            ret = lltf.status()._asdict()
+            ret['grating'] = ret['grating']._asdict()
             return ret, 200
         elif args.command == 'set_wave':
             parser.add_argument('wavelength', type=float, required=True,
@@ -1,5 +1,5 @@
 from enum import IntEnum
-from ctypes import *
+from ctypes import cdll, c_char_p
 
 # =============================================================================
 # printf = libc.printf
@@ -112,14 +112,13 @@ class NewClass():
     def __init__(self):
         print(cdll.msvcrt)
         self.libc = cdll.msvcrt
+        self._atoi = self.libc.atoi
+        self._atoi.argtypes = [c_char_p]
+        self._atoi.restype = PE_STATUS
     
     def Newfunc(self, string):
         print('In Newfunc!')
-        libc = self.libc
-        atoi = libc.atoi
-        atoi.argtypes = [c_char_p]
-        atoi.restype = PE_STATUS
-        num = atoi(string)
+        num = self._atoi(string)
         # =============================================================================
         # if num == PE_STATUS.PE_MISSING_CONFIGFILE:
         #     print('True!')
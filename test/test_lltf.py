@@ -0,0 +1,316 @@
+"""
+Tests for LLTF against FakeSDK, a Python stand-in for PE_Filter_SDK.dll installed in place of
+the library lltfdll would load. Run from the repository root with
+    python -m unittest discover -s test
+
+"""
+import unittest
+from ctypes import c_int
+
+from lltfpy import lltfdll
+from lltfpy.lltf import LLTF, LLTFError
+
+
+class FakeSDK:
+    """
+    Implements the PE_* functions of PE_Filter.h used by NKTContrast. Out-parameters arrive as
+    byref() arguments and are written through their _obj. A status code can be forced for any
+    function through fail, and every call is recorded by name in calls.
+
+    """
+    def __init__(self, harmonic=True):
+        self.calls = []
+        self.fail = {}
+        self.live = set()
+        self.created = 0
+        self.destroyed = 0
+        self.next_handle = 1000
+        self.wave = 600.0
+        #Added to every wavelength read back from the filter
+        self.offset = 0.0
+        self.harmonic = harmonic
+        self.grating = 0
+        #Central wavelength of each grating, moved by PE_SetWavelengthOnGrating
+        self.grating_center = [550.0, 850.0]
+
+    def _call(self, name, handle=None):
+        self.calls.append(name)
+        if handle is not None and handle not in self.live:
+            return 1  #PE_INVALID_HANDLE
+        return self.fail.get(name, 0)
+
+    def PE_Create(self, conffile, handle_ref):
+        status = self._call('PE_Create')
+        if not status:
+            self.next_handle += 1
+            handle_ref._obj.value = self.next_handle
+            self.live.add(self.next_handle)
+            self.created += 1
+        return status
+
+    def PE_Destroy(self, handle):
+        self.calls.append('PE_Destroy')
+        if handle not in self.live:
+            raise AssertionError('PE_Destroy called on a freed handle')
+        self.live.remove(handle)
+        self.destroyed += 1
+        return self.fail.get('PE_Destroy', 0)
+
+    def PE_GetSystemCount(self, handle):
+        self.calls.append('PE_GetSystemCount')
+        return 1
+
+    def PE_GetSystemName(self, handle, index, name, size):
+        status = self._call('PE_GetSystemName', handle)
+        if not status:
+            name.value = b'LLTF-XYZ'
+        return status
+
+    def PE_GetLibraryVersion(self):
+        self.calls.append('PE_GetLibraryVersion')
+        return (3 << 16) + (1 << 8) + 2
+
+    def PE_Open(self, handle, name):
+        return self._call('PE_Open', handle)
+
+    def PE_Close(self, handle):
+        return self._call('PE_Close', handle)
+
+    def PE_GetWavelength(self, handle, wave_ref):
+        status = self._call('PE_GetWavelength', handle)
+        if not status:
+            wave_ref._obj.value = self.wave + self.offset
+        return status
+
+    def PE_SetWavelength(self, handle, wavelength):
+        status = self._call('PE_SetWavelength', handle)
+        if not status:
+            if not 400 <= wavelength <= 1000:
+                return 5  #PE_INVALID_WAVELENGTH
+            self.wave = wavelength
+        return status
+
+    def PE_GetWavelengthRange(self, handle, min_ref, max_ref):
+        status = self._call('PE_GetWavelengthRange', handle)
+        if not status:
+            min_ref._obj.value = 400.0
+            max_ref._obj.value = 1000.0
+        return status
+
+    def PE_HasHarmonicFilter(self, handle):
+        self.calls.append('PE_HasHarmonicFilter')
+        return int(self.harmonic)
+
+    def PE_GetHarmonicFilterEnabled(self, handle, enable_ref):
+        status = self._call('PE_GetHarmonicFilterEnabled', handle)
+        if not status:
+            if not self.harmonic:
+                return 6  #PE_MISSING_HARMONIC_FILTER
+            enable_ref._obj.value = 1
+        return status
+
+    def PE_GetGrating(self, handle, index_ref):
+        status = self._call('PE_GetGrating', handle)
+        if not status:
+            index_ref._obj.value = self.grating
+        return status
+
+    def PE_GetGratingName(self, handle, index, name, size):
+        status = self._call('PE_GetGratingName', handle)
+        if not status:
+            name.value = b'G' + str(index).encode('ascii')
+        return status
+
+    def PE_GetGratingCount(self, handle, count_ref):
+        status = self._call('PE_GetGratingCount', handle)
+        if not status:
+            count_ref._obj.value = len(self.grating_center)
+        return status
+
+    def PE_GetGratingWavelengthRange(self, handle, index, min_ref, max_ref):
+        status = self._call('PE_GetGratingWavelengthRange', handle)
+        if not status:
+            min_ref._obj.value = self.grating_center[index] - 150
+            max_ref._obj.value = self.grating_center[index] + 150
+        return status
+
+    def PE_GetGratingWavelengthExtendedRange(self, handle, index, min_ref, max_ref):
+        status = self._call('PE_GetGratingWavelengthExtendedRange', handle)
+        if not status:
+            min_ref._obj.value = self.grating_center[index] - 160
+            max_ref._obj.value = self.grating_center[index] + 160
+        return status
+
+    def PE_SetWavelengthOnGrating(self, handle, index, wavelength):
+        status = self._call('PE_SetWavelengthOnGrating', handle)
+        if not status:
+            self.grating = index
+            self.grating_center[index] = wavelength
+            self.wave = wavelength
+        return status
+
+
+class LLTFTestCase(unittest.TestCase):
+    harmonic = True
+
+    def setUp(self):
+        self.sdk = FakeSDK(harmonic=self.harmonic)
+        self._library = lltfdll._library
+        lltfdll._library = self.sdk
+        self.lltf = LLTF('system.xml')
+
+    def tearDown(self):
+        lltfdll._library = self._library
+
+    def calls_during(self, func, *args, **kwargs):
+        """
+        Returns the names of the SDK functions called by func(*args, **kwargs).
+
+        """
+        self.sdk.calls.clear()
+        func(*args, **kwargs)
+        return list(self.sdk.calls)
+
+
+class TestPrototypes(unittest.TestCase):
+
+    def test_statuses_are_plain_ints(self):
+        #FakeSDK bypasses the prototypes, so check that no call can raise ValueError on a code
+        #outside PE_STATUS before its caller's status check
+        for name, (restype, argtypes) in lltfdll._PROTOTYPES.items():
+            if name != 'PE_GetStatusStr':
+                self.assertIs(restype, c_int, name)
+
+
+class TestOpenClose(LLTFTestCase):
+
+    def test_open_failure_destroys_handle(self):
+        for name, code in (('PE_Open', 2), ('PE_Open', 99), ('PE_GetSystemName', 2)):
+            self.sdk.fail = {name: code}
+            for _ in range(3):
+                self.assertRaises(LLTFError, self.lltf.get_wave)
+            self.assertIsNone(self.lltf._conn)
+            self.assertEqual(self.sdk.created, self.sdk.destroyed)
+            self.assertFalse(self.sdk.live)
+        self.sdk.fail = {}
+        self.lltf.get_wave()
+        self.assertEqual(self.lltf.name, 'LLTF-XYZ')
+
+    def test_failed_close_clears_handle(self):
+        for fail in ({'PE_Close': 2}, {'PE_Close': 99}, {'PE_Close': 2, 'PE_Destroy': 2}):
+            self.lltf.get_wave()
+            self.sdk.fail = fail
+            with self.assertRaises(LLTFError) as raised:
+                self.lltf.close()
+            if 'PE_Destroy' in fail:
+                self.assertIn('Could not destroy handle', str(raised.exception))
+            self.sdk.fail = {}
+            self.assertIsNone(self.lltf._conn)
+            self.assertFalse(self.sdk.live)
+            #A second close must not hand the freed handle back to the SDK
+            self.assertEqual(self.calls_during(self.lltf.close), [])
+
+    def test_context_manager_closes(self):
+        with self.lltf as lltf:
+            lltf.set_wave(500.0)
+        self.assertIsNone(self.lltf._conn)
+        self.assertFalse(self.sdk.live)
+
+
+class TestSetWave(LLTFTestCase):
+
+    def test_cached_wavelength_skips_sdk(self):
+        self.lltf.get_wave()
+        self.assertEqual(self.calls_during(self.lltf.set_wave, 600.0), [])
+        self.assertEqual(self.calls_during(self.lltf.set_wave, 500.0), ['PE_SetWavelength'])
+        self.assertEqual(self.lltf._last_wave, 500.0)
+        self.assertEqual(self.calls_during(self.lltf.set_wave, 500.0), [])
+
+    def test_close_forgets_wavelength(self):
+        self.lltf.set_wave(500.0)
+        self.lltf.close()
+        self.assertIsNone(self.lltf._last_wave)
+        calls = self.calls_during(self.lltf.set_wave, 510.0)
+        self.assertEqual(calls[-2:], ['PE_GetWavelength', 'PE_SetWavelength'])
+
+    def test_invalid_wavelength_raises_and_closes(self):
+        self.lltf.get_wave()
+        self.assertRaises(LLTFError, self.lltf.set_wave, 2000.0)
+        self.assertIsNone(self.lltf._conn)
+        self.assertIsNone(self.lltf._last_wave)
+
+    def test_verify(self):
+        self.assertTrue(self.lltf.set_wave(550.0, verify=True))
+        self.assertEqual(self.lltf._last_wave, 550.0)
+        self.sdk.offset = 0.01
+        self.assertRaises(LLTFError, self.lltf.set_wave, 560.0, verify=True)
+        self.assertIsNone(self.lltf._conn)
+        self.assertTrue(self.lltf.set_wave(570.0, verify=True, tolerance=0.05))
+        self.assertAlmostEqual(self.lltf._last_wave, 570.01)
+
+
+class TestSweep(LLTFTestCase):
+
+    def test_sweep_one_call_per_step(self):
+        seen = []
+        self.lltf.get_wave()
+        calls = self.calls_during(self.lltf.sweep, [500.0, 510.0, 520.0], seen.append)
+        self.assertEqual(calls, ['PE_SetWavelength']*3)
+        self.assertEqual(seen, [500.0, 510.0, 520.0])
+        self.assertEqual(self.lltf._last_wave, 520.0)
+
+    def test_sweep_tolerance(self):
+        seen = []
+        self.sdk.offset = 0.01
+        self.assertRaises(LLTFError, self.lltf.sweep, [500.0], verify=True)
+        self.assertIsNone(self.lltf._conn)
+        self.lltf.sweep([500.0, 510.0], seen.append, verify=True, tolerance=0.05)
+        self.assertEqual([round(w, 2) for w in seen], [500.01, 510.01])
+
+    def test_sweep_failure_closes(self):
+        self.assertRaises(LLTFError, self.lltf.sweep, [500.0, 2000.0])
+        self.assertIsNone(self.lltf._conn)
+        self.assertIsNone(self.lltf._last_wave)
+
+
+class TestStatus(LLTFTestCase):
+
+    def test_status(self):
+        status = self.lltf.status()
+        self.assertEqual(status.system_name, 'LLTF-XYZ')
+        self.assertEqual(status.wavelength, 600.0)
+        self.assertEqual(status.range, (400.0, 1000.0))
+        self.assertEqual(status.grating.name, 'G0')
+        self.assertEqual(status.grating.range, (400.0, 700.0))
+        self.assertEqual(status.harmonic_filter, (True, True))
+
+    def test_status_is_cached(self):
+        first = self.lltf.status()
+        calls = self.calls_during(self.lltf.status)
+        self.assertEqual(calls, ['PE_GetWavelength', 'PE_GetHarmonicFilterEnabled'])
+        self.assertEqual(self.lltf.status(), first)
+
+    def test_grating_calibration_invalidates_cache(self):
+        self.lltf.status()
+        self.assertTrue(self.lltf.grating_wave(600.0))
+        self.assertIsNone(self.lltf._meta)
+        self.assertEqual(self.lltf.status().grating.range, (450.0, 750.0))
+
+    def test_close_invalidates_cache(self):
+        self.lltf.status()
+        self.lltf.close()
+        self.assertIsNone(self.lltf._meta)
+        self.assertIn('PE_GetGrating', self.calls_during(self.lltf.status))
+
+
+class TestStatusWithoutHarmonicFilter(LLTFTestCase):
+    harmonic = False
+
+    def test_status_skips_harmonic_state(self):
+        self.assertEqual(self.lltf.status().harmonic_filter, (False, False))
+        self.assertNotIn('PE_GetHarmonicFilterEnabled', self.sdk.calls)
+        self.assertEqual(self.calls_during(self.lltf.status), ['PE_GetWavelength'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,4 +7,6 @@ def troubleshoot(string):
     num = thing.Newfunc(string)
     print(num)
     
-troubleshoot(b'3')
+if __name__ == '__main__':
+    troubleshoot(b'3')
+